@@ -0,0 +1,114 @@
+"""Change-capture installation for vkarious-managed databases."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+from .db import connect_to_database
+
+SQL_PATH = Path(__file__).parent / "sql" / "change_capture.sql"
+ROW_TRIGGER_NAME = "vkarious_row"
+
+
+class ChangeCaptureInstaller:
+    """Install the vkarious change-capture schema, functions and triggers.
+
+    The SQL lives in `sql/change_capture.sql` and is idempotent; it creates
+    the `vkarious` schema with the `change_log`/`ddl_log` tables, the row
+    capture trigger for every table with a primary key and the event
+    triggers that keep new tables covered.
+    """
+
+    def __init__(self, sql_path: Path | None = None) -> None:
+        self.sql_path = sql_path if sql_path is not None else SQL_PATH
+        self._sql_text: str | None = None
+
+    @property
+    def sql_text(self) -> str:
+        """Return the change-capture SQL, reading it on first use."""
+        if self._sql_text is None:
+            self._sql_text = self.sql_path.read_text(encoding="utf-8")
+        return self._sql_text
+
+    def is_installed(self, database_name: str) -> bool:
+        """Return True if the change-capture schema exists in DATABASE_NAME."""
+        with connect_to_database(database_name) as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT
+                      EXISTS (SELECT 1 FROM pg_namespace WHERE nspname = 'vkarious') AS has_schema,
+                      EXISTS (
+                        SELECT 1
+                        FROM pg_class c
+                        JOIN pg_namespace n ON n.oid = c.relnamespace
+                        WHERE n.nspname = 'vkarious' AND c.relname = 'change_log' AND c.relkind = 'r'
+                      ) AS has_change_log,
+                      EXISTS (
+                        SELECT 1
+                        FROM pg_proc p
+                        JOIN pg_namespace n ON n.oid = p.pronamespace
+                        WHERE n.nspname = 'vkarious' AND p.proname = 'capture'
+                      ) AS has_capture
+                """)
+                has_schema, has_change_log, has_capture = cur.fetchone()
+                return has_schema and has_change_log and has_capture
+
+    def install(self, database_name: str) -> None:
+        """Run the change-capture SQL against DATABASE_NAME."""
+        with connect_to_database(database_name) as conn:
+            with conn.cursor() as cur:
+                cur.execute(self.sql_text)
+            conn.commit()
+
+    def install_missing_triggers(self, database_name: str) -> int:
+        """Add the row trigger to primary-key tables that lack it.
+
+        Returns the number of tables that received a trigger.
+        """
+        with connect_to_database(database_name) as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT c.oid
+                    FROM pg_class c
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE c.relkind = 'r'
+                      AND n.nspname NOT IN ('pg_catalog', 'information_schema', 'vkarious')
+                      AND EXISTS (SELECT 1 FROM pg_index i WHERE i.indrelid = c.oid AND i.indisprimary)
+                """)
+                tables = self._first_column_set(cur.fetchall())
+
+                cur.execute(
+                    "SELECT tgrelid FROM pg_trigger WHERE tgname = %s AND NOT tgisinternal",
+                    (ROW_TRIGGER_NAME,),
+                )
+                missing = sorted(tables - self._first_column_set(cur.fetchall()))
+
+                if missing:
+                    cur.execute(
+                        "SELECT vkarious.install_trigger_for(rel::regclass) FROM unnest(%s::oid[]) AS rel",
+                        (missing,),
+                    )
+            conn.commit()
+        return len(missing)
+
+    @staticmethod
+    def _first_column_set(rows: list[tuple]) -> set:
+        """Return the set of first-column values from ROWS."""
+        values = set()
+        for row in rows:
+            values.add(row[0])
+        return values
+
+    def ensure_installed(self, database_name: str) -> bool:
+        """Install change-capture on DATABASE_NAME if it is not present.
+
+        Returns True when the SQL was installed, False when it was already
+        present. In the latter case any primary-key tables missing the row
+        trigger are brought up to date.
+        """
+        if not self.is_installed(database_name):
+            self.install(database_name)
+            return True
+
+        self.install_missing_triggers(database_name)
+        return False
@@ -10,21 +10,19 @@ from . import __version__
 from .db import (
     copy_database_files,
     create_branch_database,
-    create_snapshot_database,
     database_exists,
     database_write_lock,
     delete_database_record,
     drop_database,
     get_data_directory,
-    get_database_oid,
+    get_database_location,
     get_databases_with_snapshots,
     get_snapshot_record,
     initialize_database,
     list_databases,
     log_branch_operation,
-    register_branch_database,
-    register_snapshot_database,
-    register_source_database,
+    prepare_snapshot,
+    register_databases,
     restore_database_from_snapshot,
 )
 from .change_capture import ChangeCaptureInstaller
@@ -36,10 +34,16 @@ def run_command(command: list[str]) -> None:
     click.echo(result.stdout.strip())
 
 
+# Subcommands that never touch the vkarious metadata database
+NO_METADATA_COMMANDS = frozenset({"version", "databases"})
+
+
 @click.group()
-def cli() -> None:
+@click.pass_context
+def cli(ctx: click.Context) -> None:
     """Manage PostgreSQL database snapshots."""
-    initialize_database()
+    if ctx.invoked_subcommand not in NO_METADATA_COMMANDS:
+        initialize_database()
 
 
 @cli.command()
@@ -50,14 +54,10 @@ def branch(database_name: str, branch_name: str) -> None:
     try:
         click.echo(f"Creating branch '{branch_name}' of database '{database_name}'...")
         
-        # Get source database OID
-        source_oid = get_database_oid(database_name)
+        # Get source database OID and PostgreSQL data directory
+        source_oid, data_directory = get_database_location(database_name)
         click.echo(f"Source database OID: {source_oid}")
         
-        # Register source database in vka_databases table
-        register_source_database(database_name, source_oid)
-        click.echo(f"Registered source database '{database_name}' in vka_databases")
-        
         # Ensure change-capture is installed on the source
         installer = ChangeCaptureInstaller()
         if installer.ensure_installed(database_name):
@@ -65,15 +65,14 @@ def branch(database_name: str, branch_name: str) -> None:
         else:
             click.echo("vkarious change-capture already present on source database")
 
-        # Get PostgreSQL data directory
-        data_directory = get_data_directory()
         click.echo(f"PostgreSQL data directory: {data_directory}")
         
         # Create new branch database and get its OID
         branch_database_name, target_oid = create_branch_database(database_name, branch_name)
         click.echo(f"Created branch database '{branch_database_name}' with OID: {target_oid}")
         
-        # Lock the source database to prevent writes during copy
+        # Lock the source database to prevent writes during copy. No
+        # checkpoint is needed: the FILE_COPY create above already ran one.
         with database_write_lock(database_name):
             click.echo(f"Acquired write lock on database '{database_name}'")
             
@@ -87,8 +86,12 @@ def branch(database_name: str, branch_name: str) -> None:
         else:
             click.echo("vkarious change-capture already present on branch database")
         
-        # Register branch database in vka_databases table
-        register_branch_database(branch_database_name, target_oid, source_oid)
+        # Register the source and the branch in vka_databases together
+        register_databases([
+            {"oid": source_oid, "datname": database_name, "parent": None, "type": "source"},
+            {"oid": target_oid, "datname": branch_database_name, "parent": source_oid, "type": "branch"},
+        ])
+        click.echo(f"Registered source database '{database_name}' in vka_databases")
         click.echo(f"Registered branch '{branch_database_name}' in vka_databases with parent OID {source_oid}")
         
         # Log branch creation operation
@@ -109,23 +112,14 @@ def snapshot(database_name: str) -> None:
     try:
         click.echo(f"Creating snapshot of database '{database_name}'...")
         
-        # Get source database OID
-        source_oid = get_database_oid(database_name)
+        # Resolve the source and create the snapshot database
+        source_oid, data_directory, snapshot_name, target_oid = prepare_snapshot(database_name)
         click.echo(f"Source database OID: {source_oid}")
-        
-        # Register source database in vka_databases table
-        register_source_database(database_name, source_oid)
-        click.echo(f"Registered source database '{database_name}' in vka_databases")
-        
-        # Get PostgreSQL data directory
-        data_directory = get_data_directory()
         click.echo(f"PostgreSQL data directory: {data_directory}")
-        
-        # Create new snapshot database and get its OID
-        snapshot_name, target_oid = create_snapshot_database(database_name)
         click.echo(f"Created snapshot database '{snapshot_name}' with OID: {target_oid}")
         
-        # Lock the source database to prevent writes during copy
+        # Lock the source database to prevent writes during copy. No
+        # checkpoint is needed: the FILE_COPY create above already ran one.
         with database_write_lock(database_name):
             click.echo(f"Acquired write lock on database '{database_name}'")
             
@@ -133,8 +127,12 @@ def snapshot(database_name: str) -> None:
             copy_database_files(data_directory, source_oid, target_oid)
             click.echo("Database files copied successfully")
         
-        # Register snapshot database in vka_databases table
-        register_snapshot_database(snapshot_name, target_oid, source_oid)
+        # Register the source and the snapshot in vka_databases together
+        register_databases([
+            {"oid": source_oid, "datname": database_name, "parent": None, "type": "source"},
+            {"oid": target_oid, "datname": snapshot_name, "parent": source_oid, "type": "snapshot"},
+        ])
+        click.echo(f"Registered source database '{database_name}' in vka_databases")
         click.echo(f"Registered snapshot '{snapshot_name}' in vka_databases with parent OID {source_oid}")
         
         click.echo(f"Snapshot completed successfully: {snapshot_name}")
@@ -2,9 +2,14 @@
 
 from __future__ import annotations
 
+import atexit
+import functools
+import logging
 import os
+import random
 import re
-import subprocess
+import shutil
+import threading
 import time
 from contextlib import contextmanager
 from datetime import datetime
@@ -12,6 +17,34 @@ from pathlib import Path
 from typing import Iterator
 
 import psycopg
+from psycopg import sql
+from psycopg.rows import dict_row
+
+from .clone import TreeCloner
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_FILE_RE = re.compile(r"^vkarious_(\d+)\.sql$")
+
+# Advisory lock held while database files are copied or moved. Advisory
+# lock tags include the OID of the database the session is connected to,
+# and database_write_lock connects to the database being locked, so this
+# one key already gives every database its own lock.
+WRITE_LOCK_KEY = 12345
+WRITE_LOCK_TIMEOUT = 30.0
+WRITE_LOCK_RETRY_INTERVAL = 0.05
+
+# Relation cache init files hold the source's relcache; PostgreSQL rebuilds
+# them when missing, so they are never cloned into a copy
+RELCACHE_INIT_FILES = frozenset({"pg_internal.init"})
+
+# How long _terminate_backends waits for terminated backends to exit
+TERMINATE_WAIT_TIMEOUT = 2.0
+TERMINATE_POLL_INTERVAL = 0.02
+
+CREATE_DATABASE_SQL = sql.SQL("CREATE DATABASE {name}")
+CREATE_DATABASE_WITH_STRATEGY_SQL = sql.SQL("CREATE DATABASE {name} STRATEGY={strategy}")
+DROP_DATABASE_SQL = sql.SQL("DROP DATABASE IF EXISTS {name}")
 
 
 def get_database_dsn() -> str:
@@ -29,14 +62,107 @@ def connect(dsn: str | None = None) -> psycopg.Connection:
     return psycopg.connect(dsn)
 
 
+@functools.lru_cache(maxsize=None)
+def _dsn_for(database_name: str) -> str:
+    """Return the VKA_DATABASE DSN with its dbname replaced by DATABASE_NAME."""
+    conn_params = psycopg.conninfo.conninfo_to_dict(get_database_dsn())
+    conn_params['dbname'] = database_name
+    return psycopg.conninfo.make_conninfo(**conn_params)
+
+
+def connect_to_database(database_name: str) -> psycopg.Connection:
+    """Return a new connection to DATABASE_NAME on the VKA_DATABASE server."""
+    return psycopg.connect(_dsn_for(database_name))
+
+
+class ConnectionCache:
+    """Keep one open connection per database for the life of the process.
+
+    Only the server's default database and the `vkarious` metadata
+    database are meant to go through the cache; connections to user
+    databases must stay short-lived so they never block DROP DATABASE or
+    the file swap during restore.
+    """
+
+    def __init__(self) -> None:
+        self._connections: dict[str | None, psycopg.Connection] = {}
+        self._depth: dict[str | None, int] = {}
+
+    def _get(self, database_name: str | None) -> psycopg.Connection:
+        """Return the cached connection for DATABASE_NAME, reconnecting if needed."""
+        conn = self._connections.get(database_name)
+        if conn is None or conn.closed or conn.broken:
+            if database_name is None:
+                conn = connect()
+            else:
+                conn = connect_to_database(database_name)
+            self._connections[database_name] = conn
+        return conn
+
+    @contextmanager
+    def connection(self, database_name: str | None = None, autocommit: bool = False) -> Iterator[psycopg.Connection]:
+        """Yield the cached connection, committing on success and rolling back on error.
+
+        DATABASE_NAME of None means the database named in VKA_DATABASE.
+        Nested uses share the outer transaction and leave it to the outer
+        block to commit; they must ask for the same AUTOCOMMIT mode, since
+        statements such as CREATE DATABASE cannot run inside a transaction.
+        """
+        conn = self._get(database_name)
+        depth = self._depth.get(database_name, 0)
+        if depth:
+            if conn.autocommit != autocommit:
+                raise RuntimeError(
+                    f"Nested cached connection requested autocommit={autocommit} "
+                    f"inside a block using autocommit={conn.autocommit}"
+                )
+            self._depth[database_name] = depth + 1
+            try:
+                yield conn
+            finally:
+                self._depth[database_name] = depth
+            return
+
+        conn.autocommit = autocommit
+        self._depth[database_name] = 1
+        try:
+            yield conn
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        else:
+            if not autocommit:
+                conn.commit()
+        finally:
+            self._depth[database_name] = 0
+
+    def close(self) -> None:
+        """Close every cached connection."""
+        for conn in self._connections.values():
+            conn.close()
+        self._connections.clear()
+        self._depth.clear()
+
+
+_connections = ConnectionCache()
+atexit.register(_connections.close)
+
+
+def cached_connection(database_name: str | None = None, autocommit: bool = False):
+    """Return a context manager over the process-wide cached connection."""
+    return _connections.connection(database_name, autocommit)
+
+
 def list_databases() -> list[dict[str, str | int]]:
     """List all databases with their OIDs and names."""
-    with connect() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT oid, datname FROM pg_database ORDER BY datname")
-            return [{"oid": row[0], "name": row[1]} for row in cur.fetchall()]
+    with cached_connection() as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute("SELECT oid, datname AS name FROM pg_database ORDER BY datname")
+            return cur.fetchall()
 
 
+@functools.lru_cache(maxsize=1)
 def get_data_directory() -> str:
     """Return the PostgreSQL data directory path.
 
@@ -47,12 +173,14 @@ def get_data_directory() -> str:
     operations (e.g., copy-on-write file copying).
 
     Otherwise falls back to querying the server with `SHOW data_directory`.
+    The result is cached for the life of the process since the data
+    directory cannot change while the server is running.
     """
     override = os.getenv("VKA_PG_DATA_PATH")
     if override:
         return override
 
-    with connect() as conn:
+    with cached_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SHOW data_directory")
             return cur.fetchone()[0]
@@ -60,7 +188,7 @@ def get_data_directory() -> str:
 
 def get_database_oid(database_name: str) -> int:
     """Get the OID of a specific database."""
-    with connect() as conn:
+    with cached_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT oid FROM pg_database WHERE datname = %s", (database_name,))
             result = cur.fetchone()
@@ -69,50 +197,104 @@ def get_database_oid(database_name: str) -> int:
             return result[0]
 
 
-def terminate_database_connections(database_name: str) -> int:
-    """Terminate all connections to a database except the current one."""
-    with connect() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT pg_terminate_backend(pid)
-                FROM pg_stat_activity
-                WHERE datname = %s AND pid <> pg_backend_pid()
-            """, (database_name,))
-            terminated_count = cur.rowcount
-            conn.commit()
-            return terminated_count
+def _terminate_backends(cur: psycopg.Cursor, database_name: str) -> int:
+    """Terminate DATABASE_NAME's other sessions through CUR and wait for them to exit.
+
+    Returns the number of backends that were signalled. Raises
+    TimeoutError if some are still connected after
+    `TERMINATE_WAIT_TIMEOUT` seconds, so callers never move files out
+    from under a live session.
+    """
+    cur.execute("""
+        SELECT count(*)
+        FROM (
+            SELECT pg_terminate_backend(pid)
+            FROM pg_stat_activity
+            WHERE datname = %s AND pid <> pg_backend_pid()
+        ) AS terminated
+    """, (database_name,))
+    terminated_count = cur.fetchone()[0]
+
+    deadline = time.monotonic() + TERMINATE_WAIT_TIMEOUT
+    remaining = terminated_count
+    while remaining and time.monotonic() < deadline:
+        time.sleep(TERMINATE_POLL_INTERVAL)
+        cur.execute("""
+            SELECT count(*)
+            FROM pg_stat_activity
+            WHERE datname = %s AND pid <> pg_backend_pid()
+        """, (database_name,))
+        remaining = cur.fetchone()[0]
+    if remaining:
+        raise TimeoutError(
+            f"{remaining} session(s) on '{database_name}' were still connected "
+            f"{TERMINATE_WAIT_TIMEOUT} seconds after being terminated"
+        )
+    return terminated_count
+
+
+def _acquire_advisory_lock(cur: psycopg.Cursor, key: int, timeout: float) -> None:
+    """Take session advisory lock KEY, retrying until TIMEOUT seconds pass.
+
+    Retries back off exponentially with jitter so several waiting
+    vkarious processes do not poll the server in lockstep.
+    """
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+        if cur.fetchone()[0]:
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Could not acquire the vkarious write lock within {timeout} seconds")
+        delay = random.uniform(0.2, 1.0) * WRITE_LOCK_RETRY_INTERVAL * min(2 ** attempt, 32)
+        time.sleep(min(delay, remaining))
+        attempt += 1
 
 
 @contextmanager
-def database_write_lock(database_name: str) -> Iterator[None]:
-    """Context manager to acquire an exclusive lock on a database to prevent writes."""
-    # Connect to the specific database to lock it
-    db_dsn = get_database_dsn()
-    # Parse DSN and modify it to connect to the target database
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = database_name
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    conn = psycopg.connect(target_dsn)
+def database_write_lock(database_name: str, checkpoint: bool = False, terminate: bool = False) -> Iterator[None]:
+    """Context manager to acquire an exclusive lock on a database to prevent writes.
+
+    Pass `checkpoint=True` to flush dirty buffers to disk once the lock is
+    held. Restore needs it so the files it moves aside are complete and
+    no fsync requests for them are left pending. Snapshot and branch do
+    not, because their `CREATE DATABASE ... STRATEGY='FILE_COPY'` has
+    already forced a checkpoint.
+
+    With `terminate=True` every other session on the database is
+    terminated once the lock is held, reusing the lock's connection.
+
+    Raises TimeoutError if another vkarious process holds the lock for
+    longer than `WRITE_LOCK_TIMEOUT` seconds.
+    """
+    # Connect to the specific database to lock it. Session advisory locks
+    # do not need a transaction, so autocommit saves the commit round trips.
+    conn = connect_to_database(database_name)
+    conn.autocommit = True
     try:
         with conn.cursor() as cur:
-            # First terminate existing connections
-            # terminate_database_connections(database_name)
-            print("checkpoint")
-            cur.execute("CHECKPOINT")
+            # Acquire the advisory lock first; it waits until any other
+            # vkarious writer is done, so no sleep is needed afterwards
+            _acquire_advisory_lock(cur, WRITE_LOCK_KEY, WRITE_LOCK_TIMEOUT)
 
-            time.sleep(1)  # Brief pause to ensure connections are terminated
-            
-            # Acquire an advisory lock
-            cur.execute("SELECT pg_advisory_lock(12345)")
-            conn.commit()
-            
+            if terminate:
+                _terminate_backends(cur, database_name)
+
+            if checkpoint:
+                logger.debug("Running CHECKPOINT on %s under the write lock", database_name)
+                cur.execute("CHECKPOINT")
+    except BaseException:
+        conn.close()
+        raise
+
+    try:
         yield
     finally:
         with conn.cursor() as cur:
             # Release the advisory lock
-            cur.execute("SELECT pg_advisory_unlock(12345)")
-            conn.commit()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (WRITE_LOCK_KEY,))
         conn.close()
 
 
@@ -121,12 +303,16 @@ def create_snapshot_database(source_database: str) -> tuple[str, int]:
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     snapshot_name = f"snapshot_{source_database}_{timestamp}"
     
-    with connect() as conn:
-        # Set autocommit for CREATE DATABASE (required for PostgreSQL)
-        conn.autocommit = True
+    # CREATE DATABASE cannot run inside a transaction block
+    with cached_connection(autocommit=True) as conn:
         with conn.cursor() as cur:
-            # Create the new database
-            cur.execute(f'''CREATE DATABASE "{snapshot_name}" STRATEGY='FILE_COPY' ''')
+            # Create the new database. FILE_COPY is required: WAL_LOG would
+            # leave the template's pages dirty in shared buffers and in WAL,
+            # and a later flush or crash replay would overwrite the files
+            # that copy_database_files clones into place.
+            cur.execute(CREATE_DATABASE_WITH_STRATEGY_SQL.format(
+                name=sql.Identifier(snapshot_name), strategy=sql.Literal("FILE_COPY")
+            ))
             
             # Get the OID of the newly created database
             cur.execute("SELECT oid FROM pg_database WHERE datname = %s", (snapshot_name,))
@@ -135,17 +321,55 @@ def create_snapshot_database(source_database: str) -> tuple[str, int]:
     return snapshot_name, oid
 
 
+def get_database_location(database_name: str) -> tuple[int, str]:
+    """Return the OID of DATABASE_NAME and the PostgreSQL data directory.
+
+    When `VKA_PG_DATA_PATH` is set the override is used and only the OID
+    is looked up. Otherwise the OID lookup and `SHOW data_directory` are
+    pipelined on the cached connection, so both cost one round trip.
+    """
+    if os.getenv("VKA_PG_DATA_PATH"):
+        return get_database_oid(database_name), get_data_directory()
+
+    with cached_connection() as conn:
+        with conn.pipeline():
+            with conn.cursor() as oid_cur, conn.cursor() as dir_cur:
+                oid_cur.execute("SELECT oid FROM pg_database WHERE datname = %s", (database_name,))
+                dir_cur.execute("SHOW data_directory")
+                oid_row = oid_cur.fetchone()
+                data_directory = dir_cur.fetchone()[0]
+
+    if oid_row is None:
+        raise ValueError(f"Database '{database_name}' not found")
+    return oid_row[0], data_directory
+
+
+def prepare_snapshot(database_name: str) -> tuple[int, str, str, int]:
+    """Resolve DATABASE_NAME and create an empty snapshot database for it.
+
+    The snapshot database is created on the same cached connection used
+    to resolve the source. Registration is left to the caller so both
+    rows go in together.
+
+    Returns `(source_oid, data_directory, snapshot_name, snapshot_oid)`.
+    """
+    source_oid, data_directory = get_database_location(database_name)
+    snapshot_name, snapshot_oid = create_snapshot_database(database_name)
+    return source_oid, data_directory, snapshot_name, snapshot_oid
+
+
 def create_branch_database(source_database: str, branch_name: str) -> tuple[str, int]:
     """Create a new database for branch with user-provided branch name."""
     # TODO: think. we might add a prefix, though git doesnt add any prefix. 
     branch_database_name = f"{branch_name}"
     
-    with connect() as conn:
-        # Set autocommit for CREATE DATABASE (required for PostgreSQL)
-        conn.autocommit = True
+    # CREATE DATABASE cannot run inside a transaction block
+    with cached_connection(autocommit=True) as conn:
         with conn.cursor() as cur:
             # Create the new database
-            cur.execute(f'''CREATE DATABASE "{branch_database_name}" STRATEGY='FILE_COPY' ''')
+            cur.execute(CREATE_DATABASE_WITH_STRATEGY_SQL.format(
+                name=sql.Identifier(branch_database_name), strategy=sql.Literal("FILE_COPY")
+            ))
             
             # Get the OID of the newly created database
             cur.execute("SELECT oid FROM pg_database WHERE datname = %s", (branch_database_name,))
@@ -154,6 +378,28 @@ def create_branch_database(source_database: str, branch_name: str) -> tuple[str,
     return branch_database_name, oid
 
 
+def _log_rmtree_error(function, path: str, exc_info) -> None:
+    """shutil.rmtree error handler that logs the failure and carries on."""
+    logger.warning("Could not remove %s during cleanup: %s", path, exc_info[1])
+
+
+def remove_tree_in_background(path: Path) -> threading.Thread:
+    """Delete PATH recursively on a worker thread and return the thread.
+
+    The thread is not a daemon, so the interpreter waits for the removal
+    to finish before exiting instead of leaving a half-deleted directory.
+    Entries that cannot be removed are logged and skipped.
+    """
+    worker = threading.Thread(
+        target=shutil.rmtree,
+        args=(path,),
+        kwargs={"onerror": _log_rmtree_error},
+        name=f"vka-rmtree-{path.name}",
+    )
+    worker.start()
+    return worker
+
+
 def copy_database_files(data_directory: str, source_oid: int, target_oid: int) -> None:
     """Copy database files from source to target using OIDs."""
     data_path = Path(data_directory)
@@ -170,42 +416,30 @@ def copy_database_files(data_directory: str, source_oid: int, target_oid: int) -
     
     # Check VKA_NOCOW environment variable to determine copy method
     use_nocow = os.getenv("VKA_NOCOW") is not None
-    
-    subprocess.run(
-        ["rm", "-rf", str(target_path) + "/"],
-        check=True,
-        capture_output=True,
-        text=True
-    )
 
-    # Use regular cp if VKA_NOCOW is set, otherwise use cp -c for copy-on-write
-    cp_args = ["cp", "-r" if use_nocow else "-cR", str(source_path) + "/", str(target_path) + "/"]
-    
+    # Clone into a sibling staging directory, then swap it in with renames.
+    # The replaced directory only holds CREATE DATABASE's template copy, so
+    # it gets its own prefix rather than restore's `vka_delete_` backups.
+    staging_path = base_path / f"vka_tmp_{target_oid}"
+    retired_path = base_path / f"vka_retired_{target_oid}"
+    for leftover in (staging_path, retired_path):
+        if leftover.exists():
+            shutil.rmtree(leftover)
+
     try:
-        subprocess.run(
-            cp_args,
-            check=True,
-            capture_output=True,
-            text=True
-        )
-    except subprocess.CalledProcessError:
-        if not use_nocow:
-            # Fallback to regular recursive copy if cp -c is not available
-            subprocess.run(
-                ["cp", "-r", str(source_path) + "/", str(target_path) + "/"],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-        else:
-            raise
-    
-    # Remove pg_internal.init file from the copied directory
-    pg_internal_init = target_path / "pg_internal.init"
-    if pg_internal_init.exists():
-        pg_internal_init.unlink()
-    else:
-        print("no internal file ?")
+        cloner = TreeCloner(use_cow=not use_nocow, exclude=RELCACHE_INIT_FILES)
+        cloner.clone_tree(source_path, staging_path)
+    except BaseException:
+        # Leave the target untouched and drop the partial clone
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
+    os.rename(target_path, retired_path)
+    try:
+        os.rename(staging_path, target_path)
+    except OSError:
+        os.rename(retired_path, target_path)
+        raise
+    remove_tree_in_background(retired_path)
 
 
 def restore_database_from_snapshot(database_name: str, snapshot_name: str) -> dict:
@@ -217,15 +451,16 @@ def restore_database_from_snapshot(database_name: str, snapshot_name: str) -> di
     - Move the source database's data directory to a backup prefixed with `vka_delete_`.
     - Drop the source database and recreate a new one with the same name using STRATEGY='FILE_COPY'.
     - Copy the snapshot's data directory into the new database OID path using copy-on-write.
-    - Remove `pg_internal.init` from the restored directory after copy.
+    - Skip `pg_internal.init` while copying so the relcache is rebuilt.
     - Verify connectivity and that at least one table exists in the restored database.
     - Log the restore operation and update the database status to 'restored'.
 
     Returns a dict with keys: `source_oid`, `snapshot_oid`, `restored_oid`, `backup_path`, `tables_count`.
     """
     # Resolve OIDs and paths
-    source_oid = get_database_oid(database_name)
-    snapshot_record = get_snapshot_record(snapshot_name)
+    source_oid, snapshot_record = get_restore_records(database_name, snapshot_name)
+    if source_oid is None:
+        raise ValueError(f"Database '{database_name}' not found")
     if snapshot_record is None:
         raise ValueError(f"Snapshot '{snapshot_name}' not found in metadata")
 
@@ -255,9 +490,8 @@ def restore_database_from_snapshot(database_name: str, snapshot_name: str) -> di
         backup_path = base_path / f"vka_delete_{source_oid}_{timestamp}"
         
         # Safety: terminate connections and briefly lock during filesystem move
-        terminate_database_connections(database_name)
-        with database_write_lock(database_name):
-            subprocess.run(["mv", str(source_path), str(backup_path)], check=True, capture_output=True, text=True)
+        with database_write_lock(database_name, checkpoint=True, terminate=True):
+            os.rename(source_path, backup_path)
 
         # Drop and recreate the database to clear caches and allocate a new OID
         drop_database(database_name)
@@ -272,11 +506,7 @@ def restore_database_from_snapshot(database_name: str, snapshot_name: str) -> di
 
         # Post-restore validation: can connect and tables exist
         tables_count = 0
-        db_dsn = get_database_dsn()
-        params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-        params['dbname'] = database_name
-        target_dsn = psycopg.conninfo.make_conninfo(**params)
-        with psycopg.connect(target_dsn) as conn:
+        with connect_to_database(database_name) as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT 1")
                 cur.fetchone()
@@ -291,11 +521,8 @@ def restore_database_from_snapshot(database_name: str, snapshot_name: str) -> di
                 if row is not None:
                     tables_count = int(row[0])
         
-        # Update database status to 'restored' after successful validation
-        update_database_status(restored_oid, 'restored')
-        
-        # Update log with success
-        update_restore_log(log_id, "success")
+        # Mark the database 'restored' and the log entry successful
+        complete_restore(log_id, restored_oid)
         
         return {
             "source_oid": source_oid,
@@ -314,7 +541,7 @@ def restore_database_from_snapshot(database_name: str, snapshot_name: str) -> di
 def database_exists(database_name: str) -> bool:
     """Check if a database exists."""
     try:
-        with connect() as conn:
+        with cached_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (database_name,))
                 return cur.fetchone() is not None
@@ -324,31 +551,26 @@ def database_exists(database_name: str) -> bool:
 
 def create_database(database_name: str) -> None:
     """Create a database."""
-    with connect() as conn:
-        conn.autocommit = True
+    with cached_connection(autocommit=True) as conn:
         with conn.cursor() as cur:
-            cur.execute(f'CREATE DATABASE "{database_name}"')
+            cur.execute(CREATE_DATABASE_SQL.format(name=sql.Identifier(database_name)))
 
 def create_database_with_strategy(database_name: str, strategy: str = "FILE_COPY") -> None:
     """Create a database using a specific creation strategy.
 
     Mirrors the behavior used for snapshot creation (e.g., STRATEGY='FILE_COPY').
     """
-    with connect() as conn:
-        conn.autocommit = True
+    with cached_connection(autocommit=True) as conn:
         with conn.cursor() as cur:
-            cur.execute(f'''CREATE DATABASE "{database_name}" STRATEGY='{strategy}' ''')
+            cur.execute(CREATE_DATABASE_WITH_STRATEGY_SQL.format(
+                name=sql.Identifier(database_name), strategy=sql.Literal(strategy)
+            ))
 
 
 def table_exists(table_name: str, database_name: str = "vkarious") -> bool:
     """Check if a table exists in the specified database."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = database_name
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
     try:
-        with psycopg.connect(target_dsn) as conn:
+        with cached_connection(database_name) as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     SELECT 1 FROM information_schema.tables 
@@ -361,13 +583,8 @@ def table_exists(table_name: str, database_name: str = "vkarious") -> bool:
 
 def get_current_version(database_name: str = "vkarious") -> str:
     """Get the current migration version from vka_dbversion table."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = database_name
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
     try:
-        with psycopg.connect(target_dsn) as conn:
+        with cached_connection(database_name) as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT version FROM vka_dbversion LIMIT 1")
                 result = cur.fetchone()
@@ -376,216 +593,148 @@ def get_current_version(database_name: str = "vkarious") -> str:
         return '0'
 
 
+@functools.lru_cache(maxsize=1)
 def get_latest_migration_version() -> int:
     """Get the latest migration version from migration files."""
     migration_dir = Path(__file__).parent / "migration"
     if not migration_dir.exists():
         return 0
     
-    versions = []
-    for file in migration_dir.glob("vkarious_*.sql"):
-        match = re.search(r'vkarious_(\d+)\.sql', file.name)
-        if match:
-            versions.append(int(match.group(1)))
+    latest = 0
+    with os.scandir(migration_dir) as entries:
+        for entry in entries:
+            match = MIGRATION_FILE_RE.match(entry.name)
+            if match:
+                latest = max(latest, int(match.group(1)))
     
-    return max(versions) if versions else 0
+    return latest
 
 
 def execute_migration(migration_file: Path, database_name: str = "vkarious") -> None:
     """Execute a migration file against the specified database."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = database_name
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    with psycopg.connect(target_dsn) as conn:
+    with cached_connection(database_name) as conn:
         with conn.cursor() as cur:
-            with open(migration_file, 'r') as f:
-                sql = f.read()
-            cur.execute(sql)
-        conn.commit()
-
-
-def register_source_database(database_name: str, oid: int) -> None:
-    """Register a source database in vka_databases table if not already exists."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = "vkarious"
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    with psycopg.connect(target_dsn) as conn:
-        with conn.cursor() as cur:
-            # Check if database already exists in vka_databases
-            cur.execute("SELECT 1 FROM vka_databases WHERE oid = %s", (oid,))
-            if cur.fetchone() is None:
-                # Insert the source database record
-                cur.execute("""
-                    INSERT INTO vka_databases (oid, datname, parent, created_at, type, status) 
-                    VALUES (%s, %s, NULL, %s, 'source', 'live')
-                """, (oid, database_name, datetime.now()))
-        conn.commit()
-
-
-def register_snapshot_database(snapshot_name: str, snapshot_oid: int, parent_oid: int) -> None:
-    """Register a snapshot database in vka_databases table."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = "vkarious"
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    with psycopg.connect(target_dsn) as conn:
-        with conn.cursor() as cur:
-            # Insert the snapshot database record
-            cur.execute("""
-                INSERT INTO vka_databases (oid, datname, parent, created_at, type, status) 
-                VALUES (%s, %s, %s, %s, 'snapshot', 'live')
-            """, (snapshot_oid, snapshot_name, parent_oid, datetime.now()))
-        conn.commit()
-
-
-def register_branch_database(branch_name: str, branch_oid: int, parent_oid: int) -> None:
-    """Register a branch database in vka_databases table."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = "vkarious"
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    with psycopg.connect(target_dsn) as conn:
+            # Send the file's bytes as-is; psycopg accepts bytes queries, so
+            # there is no decode/re-encode round trip through str
+            cur.execute(migration_file.read_bytes())
+
+
+REGISTER_DATABASE_SQL = """
+    INSERT INTO vka_databases (oid, datname, parent, created_at, type, status)
+    SELECT %(oid)s, %(datname)s, %(parent)s::integer, now(), %(type)s::varchar, 'live'
+    WHERE %(type)s::varchar <> 'source'
+       OR NOT EXISTS (SELECT 1 FROM vka_databases WHERE oid = %(oid)s)
+"""
+
+
+def register_databases(rows: list[dict]) -> None:
+    """Register several databases in vka_databases in one transaction.
+
+    Each row is a dict with `oid`, `datname`, `parent` and `type` keys.
+    Source rows are skipped when their OID is already registered, so the
+    existence check and the insert are a single statement per row.
+    """
+    with cached_connection("vkarious") as conn:
         with conn.cursor() as cur:
-            # Insert the branch database record
-            cur.execute("""
-                INSERT INTO vka_databases (oid, datname, parent, created_at, type, status) 
-                VALUES (%s, %s, %s, %s, 'branch', 'live')
-            """, (branch_oid, branch_name, parent_oid, datetime.now()))
-        conn.commit()
+            cur.executemany(REGISTER_DATABASE_SQL, rows)
 
 
 def get_databases_with_snapshots() -> dict[str, dict]:
     """Get databases from vkarious metadata DB with their snapshots in parent-child relationship."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = "vkarious"
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    with psycopg.connect(target_dsn) as conn:
-        with conn.cursor() as cur:
-            # Get all databases from vka_databases
+    with cached_connection("vkarious") as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
+            # Get all databases from vka_databases, preferring the current
+            # name when the database has been renamed. A database is defunct
+            # when it was not restored and no longer exists in pg_database;
+            # the CTE persists that status in the same round trip.
             cur.execute("""
-                SELECT vd.oid, vd.datname, vd.parent, vd.created_at, vd.type, vd.status,
-                       pg.datname as current_datname
+                WITH mark_defunct AS (
+                    UPDATE vka_databases vd
+                    SET status = 'defunct'
+                    WHERE vd.status IS DISTINCT FROM 'restored'
+                      AND vd.status IS DISTINCT FROM 'defunct'
+                      AND NOT EXISTS (SELECT 1 FROM pg_database pg WHERE pg.oid = vd.oid)
+                )
+                SELECT vd.oid, vd.datname AS stored_name,
+                       COALESCE(pg.datname, vd.datname) AS current_name,
+                       vd.parent, vd.created_at, vd.type,
+                       CASE
+                           WHEN pg.oid IS NULL AND vd.status IS DISTINCT FROM 'restored' THEN 'defunct'
+                           ELSE vd.status
+                       END AS status
                 FROM vka_databases vd
                 LEFT JOIN pg_database pg ON vd.oid = pg.oid
-                ORDER BY vd.type, vd.created_at
+                ORDER BY vd.type <> 'source', vd.type, vd.created_at
             """)
             
+            # Sources sort first, so every parent is known by the time its
+            # snapshots arrive and one pass is enough
             databases = {}
-            snapshots = {}
             
-            for row in cur.fetchall():
-                oid, datname, parent, created_at, db_type, status, current_datname = row
+            for db_info in cur.fetchall():
+                db_info['snapshots'] = []
                 
-                # Determine if database is defunct (not restored and doesn't exist in pg_database)
-                if status != 'restored' and current_datname is None:
-                    status = 'defunct'
-                    # Update the status in the database
-                    update_database_status(oid, 'defunct')
-                
-                # Use current database name if available, fallback to stored name
-                display_name = current_datname or datname
-                
-                db_info = {
-                    'oid': oid,
-                    'stored_name': datname,
-                    'current_name': display_name,
-                    'parent': parent,
-                    'created_at': created_at,
-                    'type': db_type,
-                    'status': status,
-                    'snapshots': []
-                }
-                
-                if db_type == 'source':
-                    databases[oid] = db_info
-                else:  # snapshot
-                    snapshots[oid] = db_info
-            
-            # Organize snapshots under their parent databases
-            for snapshot_oid, snapshot_info in snapshots.items():
-                parent_oid = snapshot_info['parent']
-                if parent_oid in databases:
-                    databases[parent_oid]['snapshots'].append(snapshot_info)
+                if db_info['type'] == 'source':
+                    databases[db_info['oid']] = db_info
+                elif db_info['parent'] in databases:  # snapshot
+                    databases[db_info['parent']]['snapshots'].append(db_info)
             
             return databases
 
 
 def drop_database(database_name: str) -> None:
     """Drop a database."""
-    with connect() as conn:
-        conn.autocommit = True
+    with cached_connection(autocommit=True) as conn:
         with conn.cursor() as cur:
-            cur.execute(f'DROP DATABASE IF EXISTS "{database_name}"')
+            cur.execute(DROP_DATABASE_SQL.format(name=sql.Identifier(database_name)))
 
 
 def get_snapshot_record(snapshot_name: str) -> dict | None:
     """Get snapshot record from vka_databases table."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = "vkarious"
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    with psycopg.connect(target_dsn) as conn:
-        with conn.cursor() as cur:
+    with cached_connection("vkarious") as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
             cur.execute("""
                 SELECT oid, datname, parent, created_at, type 
                 FROM vka_databases 
                 WHERE datname = %s AND type = 'snapshot'
             """, (snapshot_name,))
-            result = cur.fetchone()
-            if result:
-                return {
-                    'oid': result[0],
-                    'datname': result[1], 
-                    'parent': result[2],
-                    'created_at': result[3],
-                    'type': result[4]
-                }
-            return None
-
-
-def update_database_status(oid: int, status: str) -> None:
-    """Update the status of a database in vka_databases table."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = "vkarious"
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    with psycopg.connect(target_dsn) as conn:
-        with conn.cursor() as cur:
-            cur.execute("UPDATE vka_databases SET status = %s WHERE oid = %s", (status, oid))
-        conn.commit()
+            return cur.fetchone()
+
+
+def get_restore_records(database_name: str, snapshot_name: str) -> tuple[int | None, dict | None]:
+    """Return the OID of DATABASE_NAME and the record of SNAPSHOT_NAME.
+
+    pg_database is a shared catalog, so the metadata connection can read
+    it alongside vka_databases and both lookups cost one round trip.
+    Either element is None when the database or snapshot is not found.
+    """
+    with cached_connection("vkarious") as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute("""
+                SELECT (SELECT oid FROM pg_database WHERE datname = %s) AS source_oid,
+                       s.oid, s.datname, s.parent, s.created_at, s.type
+                FROM (SELECT 1) AS one
+                LEFT JOIN vka_databases s ON s.datname = %s AND s.type = 'snapshot'
+                LIMIT 1
+            """, (database_name, snapshot_name))
+            record = cur.fetchone()
+
+    source_oid = record.pop('source_oid')
+    if record['oid'] is None:
+        return source_oid, None
+    return source_oid, record
 
 
 def delete_database_record(database_name: str) -> None:
     """Delete a database record from vka_databases table."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = "vkarious"
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    with psycopg.connect(target_dsn) as conn:
+    with cached_connection("vkarious") as conn:
         with conn.cursor() as cur:
             cur.execute("DELETE FROM vka_databases WHERE datname = %s", (database_name,))
-        conn.commit()
 
 
 def log_restore_operation(old_oid: int, new_oid: int, datname: str, operation: str = "restore", status: str = "started", error_description: str = None) -> int:
     """Log a restore operation to vka_log table and return the log ID."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = "vkarious"
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    with psycopg.connect(target_dsn) as conn:
+    with cached_connection("vkarious") as conn:
         with conn.cursor() as cur:
             if status == "started":
                 cur.execute("""
@@ -600,18 +749,12 @@ def log_restore_operation(old_oid: int, new_oid: int, datname: str, operation: s
                     RETURNING id
                 """, (old_oid, new_oid, datname, operation, datetime.now(), status, error_description))
             log_id = cur.fetchone()[0]
-        conn.commit()
     return log_id
 
 
 def log_branch_operation(source_oid: int, branch_oid: int, branch_name: str, operation: str = "branch", status: str = "success") -> int:
     """Log a branch creation operation to vka_log table and return the log ID."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = "vkarious"
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    with psycopg.connect(target_dsn) as conn:
+    with cached_connection("vkarious") as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 INSERT INTO vka_log (old_oid, new_oid, datname, operation, created_at, started_at, finished_at, status) 
@@ -619,25 +762,39 @@ def log_branch_operation(source_oid: int, branch_oid: int, branch_name: str, ope
                 RETURNING id
             """, (source_oid, branch_oid, branch_name, operation, datetime.now(), datetime.now(), datetime.now(), status))
             log_id = cur.fetchone()[0]
-        conn.commit()
     return log_id
 
 
 def update_restore_log(log_id: int, status: str, error_description: str = None) -> None:
     """Update a restore operation log entry."""
-    db_dsn = get_database_dsn()
-    conn_params = psycopg.conninfo.conninfo_to_dict(db_dsn)
-    conn_params['dbname'] = "vkarious"
-    target_dsn = psycopg.conninfo.make_conninfo(**conn_params)
-    
-    with psycopg.connect(target_dsn) as conn:
+    with cached_connection("vkarious") as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 UPDATE vka_log 
                 SET finished_at = %s, status = %s, error_description = %s 
                 WHERE id = %s
             """, (datetime.now(), status, error_description, log_id))
-        conn.commit()
+
+
+def complete_restore(log_id: int, restored_oid: int) -> None:
+    """Mark RESTORED_OID as restored and its log entry as successful.
+
+    Both updates and the commit go out in one pipeline, so finishing a
+    restore costs a single round trip to the metadata database.
+    """
+    with cached_connection("vkarious") as conn:
+        with conn.pipeline():
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE vka_databases SET status = 'restored' WHERE oid = %s",
+                    (restored_oid,),
+                )
+                cur.execute("""
+                    UPDATE vka_log 
+                    SET finished_at = %s, status = 'success', error_description = NULL 
+                    WHERE id = %s
+                """, (datetime.now(), log_id))
+            conn.commit()
 
 
 def initialize_database() -> None:
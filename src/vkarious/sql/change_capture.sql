@@ -0,0 +1,275 @@
+-- vkarious change-capture: DML capture with type-aware payloads, DDL
+-- auditing with timestamps and automatic row triggers for new tables that
+-- have a primary key. Safe to run repeatedly.
+
+-- 1) Core schema and tables
+
+CREATE SCHEMA IF NOT EXISTS vkarious;
+
+CREATE TABLE IF NOT EXISTS vkarious.change_log (
+  id bigserial PRIMARY KEY,
+  rel regclass NOT NULL,
+  op char(1) NOT NULL,
+  key jsonb NOT NULL,
+  cols jsonb,
+  tx xid8 NOT NULL DEFAULT pg_current_xact_id(),
+  ts timestamptz NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE TABLE IF NOT EXISTS vkarious.ddl_log (
+  id bigserial PRIMARY KEY,
+  ts timestamptz NOT NULL DEFAULT clock_timestamp(),
+  username text NOT NULL DEFAULT current_user,
+  dbname name NOT NULL DEFAULT current_database(),
+  tx xid8 NOT NULL DEFAULT pg_current_xact_id(),
+  command_tag text NOT NULL,
+  object_type text,
+  schema_name text,
+  object_identity text,
+  phase text NOT NULL,
+  sql_text text,
+  pre_def text,
+  post_def text
+);
+
+-- 2) Helpers for PK discovery and key serialization
+
+CREATE OR REPLACE FUNCTION vkarious.pk_names(rel regclass) RETURNS text[]
+LANGUAGE sql STABLE AS $$
+SELECT array_agg(a.attname::text ORDER BY a.attnum)
+FROM pg_index i
+JOIN pg_attribute a ON a.attrelid=i.indrelid AND a.attnum=ANY(i.indkey)
+WHERE i.indrelid=$1 AND i.indisprimary
+$$;
+
+-- Only the primary-key columns are read from the row, with one dynamic
+-- statement per call, so wide or TOASTed columns are never serialized.
+
+CREATE OR REPLACE FUNCTION vkarious.pk_json(rel regclass, rec anyelement) RETURNS jsonb
+LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE
+  key_sql text;
+  j jsonb;
+BEGIN
+  SELECT 'SELECT jsonb_build_object(' ||
+         string_agg(format('%L, to_jsonb(($1).%I)', a.attname, a.attname), ', ' ORDER BY a.attnum) ||
+         ')'
+  INTO key_sql
+  FROM pg_index i
+  JOIN pg_attribute a ON a.attrelid=i.indrelid AND a.attnum=ANY(i.indkey)
+  WHERE i.indrelid=rel AND i.indisprimary AND NOT a.attisdropped;
+  IF key_sql IS NULL THEN RAISE EXCEPTION 'no primary key on %', rel; END IF;
+  EXECUTE key_sql INTO j USING rec;
+  RETURN j;
+END$$;
+
+-- 3) DML capture trigger (type-aware)
+--
+-- Column values are rendered with ::text so apply_row can cast them back
+-- to the original type. All columns of a row are rendered by a single
+-- dynamic statement instead of one EXECUTE per column, and the payload is
+-- aggregated in one pass over the column arrays.
+
+CREATE OR REPLACE FUNCTION vkarious.capture() RETURNS trigger
+LANGUAGE plpgsql SECURITY DEFINER SET search_path=pg_catalog,public,vkarious AS $$
+DECLARE
+  keys jsonb;
+  delta jsonb;
+  names text[];
+  toids oid[];
+  mods int[];
+  row_text_sql text;
+  v_new text[];
+  v_old text[];
+BEGIN
+  IF TG_OP='DELETE' THEN
+    keys := vkarious.pk_json(TG_RELID::regclass, OLD);
+    INSERT INTO vkarious.change_log(rel,op,key,cols) VALUES (TG_RELID::regclass,'D',keys,NULL);
+    RETURN OLD;
+  END IF;
+
+  SELECT array_agg(a.attname::text ORDER BY a.attnum),
+         array_agg(a.atttypid ORDER BY a.attnum),
+         array_agg(a.atttypmod ORDER BY a.attnum),
+         'SELECT ARRAY[' || string_agg(format('($1).%I::text', a.attname), ',' ORDER BY a.attnum) || ']'
+  INTO names, toids, mods, row_text_sql
+  FROM pg_attribute a
+  WHERE a.attrelid=TG_RELID AND a.attnum>0 AND NOT a.attisdropped;
+
+  keys := vkarious.pk_json(TG_RELID::regclass, NEW);
+  EXECUTE row_text_sql INTO v_new USING NEW;
+
+  IF TG_OP='INSERT' THEN
+    SELECT jsonb_object_agg(c.name, jsonb_build_object('toid', c.toid, 'm', c.m, 'v', c.v))
+    INTO delta
+    FROM unnest(names, toids, mods, v_new) AS c(name, toid, m, v);
+    INSERT INTO vkarious.change_log(rel,op,key,cols) VALUES (TG_RELID::regclass,'I',keys,delta);
+    RETURN NEW;
+  END IF;
+
+  EXECUTE row_text_sql INTO v_old USING OLD;
+  IF v_new IS NOT DISTINCT FROM v_old THEN
+    RETURN NEW;
+  END IF;
+  SELECT jsonb_object_agg(c.name, jsonb_build_object('toid', c.toid, 'm', c.m, 'v', c.v))
+  INTO delta
+  FROM unnest(names, toids, mods, v_new, v_old) AS c(name, toid, m, v, old_v)
+  WHERE c.v IS DISTINCT FROM c.old_v;
+  INSERT INTO vkarious.change_log(rel,op,key,cols) VALUES (TG_RELID::regclass,'U',keys,delta);
+  RETURN NEW;
+END$$;
+
+-- 4) Apply a single log row to the base table
+
+CREATE OR REPLACE FUNCTION vkarious.apply_row(log_id bigint) RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+  r record;
+  col_name text;
+  setlist text := '';
+  coltype text;
+  q text;
+  first boolean := true;
+BEGIN
+  SELECT * INTO r FROM vkarious.change_log WHERE id=log_id;
+  IF r.op='I' THEN
+    q := 'INSERT INTO '||r.rel||'('||
+         (SELECT string_agg(quote_ident(t.k), ',') FROM jsonb_object_keys(r.cols) t(k))||
+         ') VALUES ('||
+         (
+           SELECT string_agg(
+                    CASE
+                      WHEN (r.cols->t.k->>'v') IS NULL THEN 'NULL'
+                      ELSE format('(%L)::%s', r.cols->t.k->>'v', format_type((r.cols->t.k->>'toid')::oid, (r.cols->t.k->>'m')::int))
+                    END, ',')
+           FROM jsonb_object_keys(r.cols) t(k)
+         )||')';
+    EXECUTE q;
+  ELSIF r.op='U' THEN
+    IF r.cols IS NULL THEN RETURN; END IF;
+    FOR col_name IN SELECT jsonb_object_keys(r.cols) LOOP
+      coltype := format_type((r.cols->col_name->>'toid')::oid, (r.cols->col_name->>'m')::int);
+      IF NOT first THEN setlist := setlist||', '; END IF;
+      setlist := setlist||quote_ident(col_name)||' = '||
+                 CASE WHEN (r.cols->col_name->>'v') IS NULL THEN 'NULL'
+                      ELSE format('(%L)::%s', r.cols->col_name->>'v', coltype) END;
+      first := false;
+    END LOOP;
+    q := 'UPDATE '||r.rel||' SET '||setlist||' WHERE ('||
+         (SELECT string_agg(quote_ident(t.k), ',') FROM jsonb_object_keys(r.key) t(k))||
+         ') = ('||
+         (SELECT string_agg(
+                   CASE WHEN r.key->>t.k IS NULL THEN 'NULL'
+                        ELSE format('%L', r.key->>t.k) END, ',')
+          FROM jsonb_object_keys(r.key) t(k))||
+         ')';
+    EXECUTE q;
+  ELSIF r.op='D' THEN
+    q := 'DELETE FROM '||r.rel||' WHERE ('||
+         (SELECT string_agg(quote_ident(t.k), ',') FROM jsonb_object_keys(r.key) t(k))||
+         ') = ('||
+         (SELECT string_agg(
+                   CASE WHEN r.key->>t.k IS NULL THEN 'NULL'
+                        ELSE format('%L', r.key->>t.k) END, ',')
+          FROM jsonb_object_keys(r.key) t(k))||
+         ')';
+    EXECUTE q;
+  END IF;
+END$$;
+
+-- 5) Install row triggers on a table that has a PK
+
+CREATE OR REPLACE FUNCTION vkarious.install_trigger_for(rel regclass) RETURNS void
+LANGUAGE plpgsql SECURITY DEFINER AS $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_index i WHERE i.indrelid=rel AND i.indisprimary) THEN
+    EXECUTE format('DROP TRIGGER IF EXISTS vkarious_row ON %s', rel);
+    EXECUTE format('CREATE TRIGGER vkarious_row AFTER INSERT OR UPDATE OR DELETE ON %s FOR EACH ROW EXECUTE FUNCTION vkarious.capture()', rel);
+  END IF;
+END$$;
+
+-- 6) Install row triggers on existing user tables that have a PK
+
+SELECT vkarious.install_trigger_for(c.oid::regclass)
+FROM pg_class c
+JOIN pg_namespace n ON n.oid=c.relnamespace
+WHERE c.relkind='r'
+  AND n.nspname NOT IN ('pg_catalog','information_schema','vkarious')
+  AND EXISTS (SELECT 1 FROM pg_index i WHERE i.indrelid=c.oid AND i.indisprimary);
+
+-- 7) Auto-install triggers for new tables with a PK
+
+CREATE OR REPLACE FUNCTION vkarious.on_ddl_end_install() RETURNS event_trigger
+LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE r record;
+BEGIN
+  FOR r IN SELECT * FROM pg_event_trigger_ddl_commands() LOOP
+    IF r.schema_name NOT IN ('pg_catalog','information_schema','vkarious')
+       AND r.object_type = 'table' THEN
+      PERFORM vkarious.install_trigger_for(r.objid::regclass);
+    END IF;
+  END LOOP;
+END$$;
+
+DROP EVENT TRIGGER IF EXISTS vkarious_ddl_end_install;
+CREATE EVENT TRIGGER vkarious_ddl_end_install ON ddl_command_end EXECUTE FUNCTION vkarious.on_ddl_end_install();
+
+-- 8) DDL auditing with timestamps
+--
+-- pg_event_trigger_ddl_commands() is only available at ddl_command_end, so
+-- the start phase records the command tag and statement text only.
+
+CREATE OR REPLACE FUNCTION vkarious.ddl_start() RETURNS event_trigger
+LANGUAGE plpgsql SECURITY DEFINER AS $$
+BEGIN
+  INSERT INTO vkarious.ddl_log(command_tag,phase,sql_text)
+  VALUES (TG_TAG,'start',current_query());
+END$$;
+
+CREATE OR REPLACE FUNCTION vkarious.ddl_end() RETURNS event_trigger
+LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE r record;
+BEGIN
+  FOR r IN SELECT * FROM pg_event_trigger_ddl_commands() LOOP
+    INSERT INTO vkarious.ddl_log(command_tag,object_type,schema_name,object_identity,phase,sql_text,post_def)
+    VALUES (
+      r.command_tag,r.object_type,r.schema_name,r.object_identity,'end',current_query(),
+      CASE r.object_type
+        WHEN 'view' THEN pg_get_viewdef(r.objid,true)
+        WHEN 'materialized view' THEN pg_get_viewdef(r.objid,true)
+        WHEN 'function' THEN pg_get_functiondef(r.objid)
+        WHEN 'index' THEN pg_get_indexdef(r.objid)
+        ELSE NULL
+      END
+    );
+  END LOOP;
+END$$;
+
+CREATE OR REPLACE FUNCTION vkarious.ddl_drop() RETURNS event_trigger
+LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE r record;
+BEGIN
+  FOR r IN SELECT * FROM pg_event_trigger_dropped_objects() WHERE original LOOP
+    INSERT INTO vkarious.ddl_log(command_tag,object_type,schema_name,object_identity,phase,sql_text)
+    VALUES (TG_TAG,r.object_type,r.schema_name,r.object_identity,'end',current_query());
+  END LOOP;
+END$$;
+
+CREATE OR REPLACE FUNCTION vkarious.on_table_rewrite() RETURNS event_trigger
+LANGUAGE plpgsql SECURITY DEFINER AS $$
+BEGIN
+  INSERT INTO vkarious.ddl_log(command_tag,object_type,object_identity,phase)
+  VALUES ('TABLE REWRITE','table', pg_event_trigger_table_rewrite_oid()::regclass::text, 'end');
+END$$;
+
+DROP EVENT TRIGGER IF EXISTS vkarious_ddl_start;
+CREATE EVENT TRIGGER vkarious_ddl_start ON ddl_command_start EXECUTE FUNCTION vkarious.ddl_start();
+
+DROP EVENT TRIGGER IF EXISTS vkarious_ddl_end;
+CREATE EVENT TRIGGER vkarious_ddl_end ON ddl_command_end EXECUTE FUNCTION vkarious.ddl_end();
+
+DROP EVENT TRIGGER IF EXISTS vkarious_sql_drop;
+CREATE EVENT TRIGGER vkarious_sql_drop ON sql_drop EXECUTE FUNCTION vkarious.ddl_drop();
+
+DROP EVENT TRIGGER IF EXISTS vkarious_table_rewrite;
+CREATE EVENT TRIGGER vkarious_table_rewrite ON table_rewrite EXECUTE FUNCTION vkarious.on_table_rewrite();
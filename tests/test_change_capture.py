@@ -0,0 +1,165 @@
+import os
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from vkarious import change_capture
+from vkarious.change_capture import ChangeCaptureInstaller
+from vkarious.db import connect_to_database, create_database, drop_database
+
+
+class FakeCursor:
+    def __init__(self, conn: "FakeConnection") -> None:
+        self.conn = conn
+        self.rows: list[tuple] = []
+
+    def __enter__(self) -> "FakeCursor":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        return None
+
+    def execute(self, query: str, params: tuple | None = None) -> None:
+        self.conn.executed.append((query, params))
+        self.rows = []
+        for fragment, rows in self.conn.results.items():
+            if fragment in query:
+                self.rows = rows
+                break
+
+    def fetchone(self) -> tuple | None:
+        if self.rows:
+            return self.rows[0]
+        return None
+
+    def fetchall(self) -> list[tuple]:
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, results: dict[str, list[tuple]]) -> None:
+        self.results = results
+        self.executed: list[tuple[str, tuple | None]] = []
+        self.commits = 0
+
+    def __enter__(self) -> "FakeConnection":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        return None
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        self.commits += 1
+
+
+def connect_returning(conn: FakeConnection):
+    def connect(database_name: str) -> FakeConnection:
+        return conn
+    return connect
+
+
+def test_ensure_installed_runs_sql_when_missing(monkeypatch, tmp_path) -> None:
+    sql_file = tmp_path / "change_capture.sql"
+    sql_file.write_text("CREATE SCHEMA IF NOT EXISTS vkarious;")
+    conn = FakeConnection({"has_capture": [(False, False, False)]})
+    monkeypatch.setattr(change_capture, "connect_to_database", connect_returning(conn))
+
+    installer = ChangeCaptureInstaller(sql_file)
+
+    assert installer.ensure_installed("maindb") is True
+    assert conn.executed[-1][0] == "CREATE SCHEMA IF NOT EXISTS vkarious;"
+    assert conn.commits == 1
+
+
+def test_ensure_installed_only_adds_missing_triggers(monkeypatch) -> None:
+    conn = FakeConnection({
+        "has_capture": [(True, True, True)],
+        "SELECT c.oid": [(10,), (11,), (12,)],
+        "FROM pg_trigger": [(11,)],
+    })
+    monkeypatch.setattr(change_capture, "connect_to_database", connect_returning(conn))
+
+    installer = ChangeCaptureInstaller()
+
+    assert installer.ensure_installed("maindb") is False
+    install_calls = []
+    for query, params in conn.executed:
+        if "install_trigger_for" in query:
+            install_calls.append(params)
+    assert install_calls == [([10, 12],)]
+
+
+@pytest.fixture
+def scratch_database():
+    name = f"vka_cc_test_{uuid.uuid4().hex[:8]}"
+    create_database(name)
+    try:
+        yield name
+    finally:
+        drop_database(name)
+
+
+def change_log_rows(cur, rel: str) -> list[tuple]:
+    cur.execute(
+        "SELECT id, op, key, cols FROM vkarious.change_log WHERE rel = %s::regclass ORDER BY id",
+        (rel,),
+    )
+    return cur.fetchall()
+
+
+@pytest.mark.skipif(
+    not os.getenv("VKA_DATABASE"),
+    reason="needs VKA_DATABASE pointing at a superuser connection",
+)
+def test_change_capture_records_and_replays_changes(scratch_database) -> None:
+    assert ChangeCaptureInstaller().ensure_installed(scratch_database) is True
+
+    with connect_to_database(scratch_database) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            # The event trigger logs the DDL and installs the row trigger
+            cur.execute("CREATE TABLE public.items (id int PRIMARY KEY, txt text, n numeric(10,2))")
+            cur.execute("""
+                SELECT count(*) FROM vkarious.ddl_log
+                WHERE command_tag = 'CREATE TABLE' AND object_identity = 'public.items' AND phase = 'end'
+            """)
+            assert cur.fetchone()[0] == 1
+            cur.execute("""
+                SELECT count(*) FROM pg_trigger
+                WHERE tgrelid = 'public.items'::regclass AND tgname = 'vkarious_row'
+            """)
+            assert cur.fetchone()[0] == 1
+
+            cur.execute("INSERT INTO public.items VALUES (1, 'a', 10.50)")
+            cur.execute("UPDATE public.items SET txt = 'b' WHERE id = 1")
+            cur.execute("DELETE FROM public.items WHERE id = 1")
+
+            rows = change_log_rows(cur, "public.items")
+            ops = ""
+            for row in rows:
+                ops += row[1]
+            assert ops == "IUD"
+
+            insert_row, update_row, delete_row = rows
+            assert insert_row[2] == {"id": 1}
+            assert insert_row[3]["txt"]["v"] == "a"
+            assert insert_row[3]["n"]["v"] == "10.50"
+            assert update_row[2] == {"id": 1}
+            assert set(update_row[3]) == {"txt"}
+            assert update_row[3]["txt"]["v"] == "b"
+            assert delete_row[2] == {"id": 1}
+            assert delete_row[3] is None
+
+            # Replaying the insert and update rebuilds the row
+            cur.execute("SELECT vkarious.apply_row(%s)", (insert_row[0],))
+            cur.execute("SELECT vkarious.apply_row(%s)", (update_row[0],))
+            cur.execute("SELECT id, txt, n FROM public.items")
+            assert cur.fetchall() == [(1, "b", Decimal("10.50"))]
+
+            cur.execute("SELECT vkarious.apply_row(%s)", (delete_row[0],))
+            cur.execute("SELECT count(*) FROM public.items")
+            assert cur.fetchone()[0] == 0
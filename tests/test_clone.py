@@ -0,0 +1,32 @@
+import pytest
+
+from vkarious.clone import TreeCloner
+
+
+@pytest.mark.parametrize("use_cow", [True, False])
+def test_clone_tree_copies_nested_files(tmp_path, use_cow: bool) -> None:
+    source = tmp_path / "16384"
+    (source / "sub").mkdir(parents=True)
+    (source / "1259").write_bytes(b"relation")
+    (source / "sub" / "PG_VERSION").write_text("16\n")
+    (source / "1259").chmod(0o600)
+
+    target = tmp_path / "16385"
+    TreeCloner(use_cow=use_cow).clone_tree(source, target)
+
+    assert (target / "1259").read_bytes() == b"relation"
+    assert (target / "sub" / "PG_VERSION").read_text() == "16\n"
+    assert (target / "1259").stat().st_mode & 0o777 == 0o600
+
+
+def test_clone_tree_skips_excluded_top_level_files(tmp_path) -> None:
+    source = tmp_path / "16384"
+    source.mkdir()
+    (source / "1259").write_bytes(b"relation")
+    (source / "pg_internal.init").write_bytes(b"relcache")
+
+    target = tmp_path / "16385"
+    TreeCloner(exclude=frozenset({"pg_internal.init"})).clone_tree(source, target)
+
+    assert (target / "1259").read_bytes() == b"relation"
+    assert not (target / "pg_internal.init").exists()
@@ -0,0 +1,219 @@
+from pathlib import Path
+
+import pytest
+
+from vkarious import db
+from vkarious.clone import TreeCloner
+from vkarious.db import copy_database_files
+
+
+class ScriptedCursor:
+    """Cursor whose fetchone returns scripted values; the last one repeats."""
+
+    def __init__(self, values: list) -> None:
+        self.values = values
+        self.executed: list[tuple[str, tuple | None]] = []
+        self.row: tuple | None = None
+
+    def execute(self, query: str, params: tuple | None = None) -> None:
+        self.executed.append((query, params))
+        if len(self.values) > 1:
+            self.row = (self.values.pop(0),)
+        else:
+            self.row = (self.values[0],)
+
+    def fetchone(self) -> tuple | None:
+        return self.row
+
+
+class FakeClock:
+    """Stand-in for the time module whose sleep advances monotonic."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_database_dirs(data_directory: Path) -> tuple[Path, Path]:
+    base = data_directory / "base"
+    source = base / "16384"
+    target = base / "16385"
+    source.mkdir(parents=True)
+    target.mkdir()
+    (source / "1259").write_bytes(b"relation")
+    (source / "pg_internal.init").write_bytes(b"relcache")
+    (target / "1259").write_bytes(b"empty")
+    (target / "PG_VERSION").write_text("16\n")
+    return source, target
+
+
+def test_copy_database_files_swaps_in_clone(tmp_path) -> None:
+    source, target = make_database_dirs(tmp_path)
+
+    copy_database_files(str(tmp_path), 16384, 16385)
+
+    assert (target / "1259").read_bytes() == b"relation"
+    assert not (target / "PG_VERSION").exists()
+    assert not (target / "pg_internal.init").exists()
+    assert (source / "pg_internal.init").exists()
+    assert not (tmp_path / "base" / "vka_tmp_16385").exists()
+    assert not (tmp_path / "base" / "vka_delete_16385").exists()
+
+
+def test_copy_database_files_leaves_target_when_clone_fails(monkeypatch, tmp_path) -> None:
+    source, target = make_database_dirs(tmp_path)
+
+    def failing_clone_tree(self: TreeCloner, source: Path, target: Path) -> None:
+        target.mkdir()
+        (target / "1259").write_bytes(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(TreeCloner, "clone_tree", failing_clone_tree)
+
+    with pytest.raises(OSError, match="disk full"):
+        copy_database_files(str(tmp_path), 16384, 16385)
+
+    assert (target / "1259").read_bytes() == b"empty"
+    assert (target / "PG_VERSION").read_text() == "16\n"
+    assert not (tmp_path / "base" / "vka_tmp_16385").exists()
+    assert not (tmp_path / "base" / "vka_retired_16385").exists()
+
+
+def test_terminate_backends_raises_when_sessions_linger(monkeypatch) -> None:
+    clock = FakeClock()
+    monkeypatch.setattr(db, "time", clock)
+    cur = ScriptedCursor([2, 1])
+
+    with pytest.raises(TimeoutError, match="still connected"):
+        db._terminate_backends(cur, "maindb")
+
+    assert clock.now >= db.TERMINATE_WAIT_TIMEOUT
+
+
+def test_terminate_backends_returns_count_once_sessions_exit(monkeypatch) -> None:
+    monkeypatch.setattr(db, "time", FakeClock())
+    cur = ScriptedCursor([2, 1, 0])
+
+    assert db._terminate_backends(cur, "maindb") == 2
+    assert len(cur.executed) == 3
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.autocommit = False
+        self.closed = False
+        self.broken = False
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self) -> None:
+        self.commits += 1
+
+    def rollback(self) -> None:
+        self.rollbacks += 1
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class ConnectionFactory:
+    def __init__(self) -> None:
+        self.made: list[FakeConnection] = []
+
+    def __call__(self, dsn: str | None = None) -> FakeConnection:
+        conn = FakeConnection()
+        self.made.append(conn)
+        return conn
+
+
+@pytest.fixture
+def connection_factory(monkeypatch) -> ConnectionFactory:
+    factory = ConnectionFactory()
+    monkeypatch.setattr(db, "connect", factory)
+    return factory
+
+
+def test_connection_cache_commits_on_success(connection_factory) -> None:
+    cache = db.ConnectionCache()
+
+    with cache.connection() as conn:
+        pass
+
+    assert conn.commits == 1
+    assert conn.rollbacks == 0
+
+
+def test_connection_cache_rolls_back_on_error(connection_factory) -> None:
+    cache = db.ConnectionCache()
+
+    with pytest.raises(ValueError):
+        with cache.connection() as conn:
+            raise ValueError("boom")
+
+    assert conn.commits == 0
+    assert conn.rollbacks == 1
+
+
+def test_connection_cache_nested_use_shares_outer_transaction(connection_factory) -> None:
+    cache = db.ConnectionCache()
+
+    with cache.connection() as outer:
+        with cache.connection() as inner:
+            assert inner is outer
+        assert outer.commits == 0
+
+    assert outer.commits == 1
+    assert len(connection_factory.made) == 1
+
+
+def test_connection_cache_rejects_nested_autocommit_change(connection_factory) -> None:
+    cache = db.ConnectionCache()
+
+    with pytest.raises(RuntimeError, match="autocommit"):
+        with cache.connection():
+            with cache.connection(autocommit=True):
+                pass
+
+
+def test_connection_cache_reconnects_closed_connection(connection_factory) -> None:
+    cache = db.ConnectionCache()
+
+    with cache.connection() as first:
+        pass
+    first.closed = True
+    with cache.connection() as second:
+        pass
+
+    assert second is not first
+    assert len(connection_factory.made) == 2
+
+
+def test_acquire_advisory_lock_retries_until_granted(monkeypatch) -> None:
+    clock = FakeClock()
+    monkeypatch.setattr(db, "time", clock)
+    cur = ScriptedCursor([False, False, False, True])
+
+    db._acquire_advisory_lock(cur, db.WRITE_LOCK_KEY, 30.0)
+
+    assert len(cur.executed) == 4
+    assert len(clock.sleeps) == 3
+    assert clock.sleeps[0] <= db.WRITE_LOCK_RETRY_INTERVAL
+
+
+def test_acquire_advisory_lock_times_out_at_deadline(monkeypatch) -> None:
+    clock = FakeClock()
+    monkeypatch.setattr(db, "time", clock)
+    cur = ScriptedCursor([False])
+
+    with pytest.raises(TimeoutError):
+        db._acquire_advisory_lock(cur, db.WRITE_LOCK_KEY, 1.0)
+
+    assert clock.now == pytest.approx(1.0)
+    assert max(clock.sleeps) <= db.WRITE_LOCK_RETRY_INTERVAL * 32